@@ -1,18 +1,37 @@
 from ArizonaPlantVectorStore import ArizonaPlantVectorStore
 
-from openai import OpenAI
+from openai import AsyncOpenAI
+
+import textwrap
+
+# Fixed instructions, sent as the system message; kept short and dedented
+# so each request spends fewer prompt tokens on boilerplate
+SYSTEM_PROMPT = textwrap.dedent("""
+    You are an expert on Arizona desert plants. Answer the user's question using the provided context documents from authoritative sources.
+    - Give a clear, detailed answer based on the context
+    - Include scientific names when the context has them
+    - Make care instructions specific to Arizona conditions
+    - Say so if the context doesn't fully answer the question
+    - Cite the documents you use (e.g., "According to Document 1...")
+""").strip()
 
 class ArizonaPlantRAG:
     def __init__(self, vector_store: ArizonaPlantVectorStore, openai_client = None):
         self.vector_store = vector_store
         if openai_client:
+            # llm()/rag() await the client, so a sync OpenAI() client can't work
+            if not isinstance(openai_client, AsyncOpenAI):
+                raise TypeError("openai_client must be an AsyncOpenAI instance")
             self.openai_client = openai_client
         else:
-            self.openai_client = OpenAI()
+            self.openai_client = AsyncOpenAI()
     
     def build_prompt(self, query, search_results):
         """
-        Build a prompt for the LLM using retrieved documents
+        Build the user prompt for the LLM using retrieved documents
+        
+        The fixed instructions live in SYSTEM_PROMPT; this only holds the
+        per-request context and question
         
         Args:
             query: User's question
@@ -22,74 +41,97 @@ class ArizonaPlantRAG:
             Formatted prompt string
         """
         # Build context from search results
-        context_parts = []
-        
-        for i, result in enumerate(search_results, 1):
-            context_parts.append(f"Document {i} (Score: {result['score']:.3f}):")
-            context_parts.append(f"Title: {result['title']}")
-            context_parts.append(f"Source: {result['source']}")
-            context_parts.append(f"Content: {result['content']}")
-            context_parts.append("")  # blank line
+        context = "\n".join(
+            f"Document {i} (Score: {result['score']:.3f}):\n"
+            f"Title: {result['title']}\n"
+            f"Source: {result['source']}\n"
+            f"Content: {result['content']}\n"
+            for i, result in enumerate(search_results, 1)
+        )
         
-        context = "\n".join(context_parts)
+        # Build the user prompt (no leading indentation; it is sent as tokens)
+        prompt = (
+            "Context from relevant documents:\n"
+            f"{context}\n"
+            f"User Question: {query}"
+        )
         
-        # Build the full prompt
-        prompt = f"""You are an expert on Arizona desert plants. Answer the user's question based on the provided context from authoritative sources.
+        return prompt
 
-        Context from relevant documents:
-        {context}
 
-        User Question: {query}
+    async def start_stream(self, prompt):
+        """
+        Open a streaming completion with the OpenAI API
+        
+        The request is sent here, so auth/rate-limit/model errors are raised
+        before any answer text is consumed
+        
+        Args:
+            prompt: User prompt with context and question
+            
+        Returns:
+            OpenAI async stream of completion chunks
+        """
+        
+        return await self.openai_client.chat.completions.create(
+            model='gpt-4o-mini',
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.7,  # Slightly creative but mostly factual
+            max_tokens=500,   # Adjust based on your needs
+            stream=True
+        )
 
-        Instructions:
-        - Provide a clear, detailed answer based on the context above
-        - If the context contains scientific names, include them
-        - If mentioning care instructions, be specific about Arizona conditions
-        - If the context doesn't fully answer the question, say so
-        - Cite which document(s) you're drawing from (e.g., "According to Document 1...")
 
-        Answer:""".strip()
+    async def stream_text(self, stream):
+        """
+        Yield the answer text from an opened completion stream
         
-        return prompt
+        Args:
+            stream: Stream returned by start_stream()
+            
+        Yields:
+            Answer text chunks
+        """
+        
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
 
 
-    def llm(self, prompt):
+    async def llm(self, prompt):
         """
         Call OpenAI API to generate answer
         
         Args:
-            prompt: Full prompt with context and question
+            prompt: User prompt with context and question
             
         Returns:
             Generated answer string
         """
         
-        response = self.openai_client.chat.completions.create(
-            model='gpt-4o-mini',
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,  # Slightly creative but mostly factual
-            max_tokens=500    # Adjust based on your needs
-        )
-        
-        return response.choices[0].message.content
+        stream = await self.start_stream(prompt)
+        return "".join([text async for text in self.stream_text(stream)])
 
 
-    def rag(self, query):
+    async def rag(self, query, limit=5) -> tuple[str, list[dict]]:
         """
         Complete RAG pipeline: Retrieve relevant docs and generate answer
         
         Args:
             query: User's question
-            vector_store: Initialized ArizonaPlantVectorStore instance
+            limit: Number of documents to retrieve as context
             
         Returns:
-            Generated answer string
+            Tuple of (generated answer string, retrieved documents)
         """
         # Step 1: Retrieve relevant documents
         print("\n" + "="*60)
         print("RAG Pipeline")
         print("="*60)
-        search_results = self.vector_store.search(query, limit=5)
+        search_results = await self.vector_store.search_async(query, limit=limit)
         
         # Step 2: Build prompt with context
         prompt = self.build_prompt(query, search_results)
@@ -102,9 +144,9 @@ class ArizonaPlantRAG:
         
         # Step 3: Generate answer
         print("Generating answer...")
-        answer = self.llm(prompt)
+        answer = await self.llm(prompt)
         
         print("✓ Answer generated")
         print("="*60 + "\n")
         
-        return answer
+        return answer, search_results
@@ -1,53 +1,155 @@
+from functools import lru_cache
+
+import os
+import anyio
+import numpy as np
+import torch
+
 from qdrant_client import QdrantClient
+from qdrant_client.models import SearchParams, QuantizationSearchParams, PayloadSelectorInclude
 from sentence_transformers import SentenceTransformer
 
+# Keepalive pings on the long-lived shared channel, also while it sits idle
+# between requests, so a dropped connection is detected before the next search
+GRPC_OPTIONS = {
+    'grpc.keepalive_time_ms': 30000,
+    'grpc.keepalive_timeout_ms': 10000,
+    'grpc.keepalive_permit_without_calls': 1,
+}
+
+# Payload fields returned with each hit (metadata is only fetched on request)
+PAYLOAD_FIELDS = ['id', 'title', 'content', 'type', 'source']
+
+# int8 dynamic-quantized ONNX export shipped with the sentence-transformers models
+ONNX_MODEL_FILE = 'onnx/model_qint8_avx512_vnni.onnx'
+
+_torch_threads_configured = False
+
+def configure_torch_threads():
+    """Pin torch thread pools once per process (safe to call repeatedly)"""
+    global _torch_threads_configured
+    if _torch_threads_configured:
+        return
+    _torch_threads_configured = True
+    
+    # CPUs this process may run on (respects container/cpuset limits)
+    if hasattr(os, 'sched_getaffinity'):
+        cpu_count = len(os.sched_getaffinity(0))
+    else:
+        cpu_count = os.cpu_count() or 1
+    
+    # Use every core for intra-op math (some deployments default to 1 thread)
+    torch.set_num_threads(cpu_count)
+    try:
+        torch.set_num_interop_threads(2)
+    except RuntimeError:
+        # Already set, or inter-op work already ran in this process
+        pass
+
 class ArizonaPlantVectorStore:
+    """
+    Query-side access to the Arizona plants Qdrant collection
+    
+    Searches pass hnsw_ef=48 (Qdrant otherwise uses the collection's
+    ef_construct, 100 here). This only matters once segments grow past Qdrant's
+    indexing_threshold (20,000 KB by default) and get an HNSW graph. The current
+    collection (~340 x 384 floats, ~0.5 MB) stays unindexed, so every search is
+    an exact scan and ef has no effect. On a larger collection, 48 trades a
+    little recall for lower latency at top_k <= 10.
+    """
     def __init__(self, 
                  embedding_model_name='all-MiniLM-L6-v2',
                  collection_name='arizona_plants',
-                 qdrant_url='http://localhost:6333'):
+                 qdrant_url='http://localhost:6333',
+                 embedding_backend='onnx'):
         """
         Initialize the vector store
         
         Args:
             embedding_model_name: SentenceTransformer model name
             collection_name: Name for the Qdrant collection
+            embedding_backend: 'onnx' (quantized ONNX Runtime, CPU) or 'torch'
         """
         self.collection_name = collection_name
         self.qdrant_url = qdrant_url
         
+        configure_torch_threads()
+        
         # Initialize embedding model
-        print(f"Loading embedding model: {embedding_model_name}")
-        self.embedding_model = SentenceTransformer(embedding_model_name)
+        print(f"Loading embedding model: {embedding_model_name} ({embedding_backend})")
+        if embedding_backend == 'onnx':
+            self.embedding_model = SentenceTransformer(
+                embedding_model_name,
+                backend='onnx',
+                model_kwargs={'file_name': ONNX_MODEL_FILE, 'provider': 'CPUExecutionProvider'}
+            )
+        else:
+            self.embedding_model = SentenceTransformer(embedding_model_name)
+            if self.embedding_model.device.type == 'cuda':
+                self.embedding_model.half()
+            else:
+                # Let oneDNN run FP32 matmuls on BF16 kernels (AMX/AVX-512)
+                torch.backends.mkldnn.matmul.fp32_precision = 'bf16'
+        self.embedding_model.eval()
         self.embedding_dim = self.embedding_model.get_sentence_embedding_dimension()
         print(f"✓ Model loaded (dimension: {self.embedding_dim})")
         
-        # Initialize Qdrant client
-        self.client = QdrantClient(url=self.qdrant_url)
-        print("✓ Qdrant client initialized")
+        # Initialize Qdrant client (shared by all requests, thread-safe gRPC channel)
+        self.client = QdrantClient(url=self.qdrant_url, prefer_grpc=True, grpc_options=GRPC_OPTIONS)
+        print("✓ Qdrant client initialized (gRPC)")
+        
+        # Cache query embeddings per instance (same question -> same vector)
+        self._encode_cached = lru_cache(maxsize=1024)(self._encode)
     
-    def search(self, query: str, limit: int = 5):
+    def _encode(self, query: str) -> np.ndarray:
+        """
+        Encode a query string into an embedding
+        
+        Args:
+            query: Query string to encode
+            
+        Returns:
+            Read-only float32 embedding (shared by every cache hit)
+        """
+        with torch.inference_mode():
+            # Unit-normalized so the collection's DOT distance equals cosine similarity
+            query_embedding = self.embedding_model.encode(
+                query, convert_to_numpy=True, normalize_embeddings=True
+            )
+        query_embedding.setflags(write=False)
+        return query_embedding
+    
+    def search(self, query: str, limit: int = 5, with_metadata: bool = False):
         """
         Search for relevant documents using pre-computed embeddings
         
         Args:
             query: Search query string
             limit: Number of results to return
+            with_metadata: Also return the metadata payload (not needed by the API)
             
         Returns:
             List of search results with metadata
         """
         print(f'Searching for: "{query}"')
         
-        # Encode the query using SentenceTransformer
-        query_embedding = self.embedding_model.encode(query)
+        # Encode the query using SentenceTransformer (cached for repeat queries)
+        query_embedding = self._encode_cached(query)
         
         # Search in Qdrant using the embedding vector
         search_results = self.client.query_points(
             collection_name=self.collection_name,
-            query=query_embedding.tolist(),  # Pass the vector directly, not wrapped in Document
+            query=query_embedding,  # numpy array; qdrant-client converts it with .tolist()
             limit=limit,
-            with_payload=True
+            with_payload=PayloadSelectorInclude(
+                include=PAYLOAD_FIELDS + ['metadata'] if with_metadata else PAYLOAD_FIELDS
+            ),
+            # Search on int8 vectors, then rescore the top candidates in float32
+            search_params=SearchParams(
+                hnsw_ef=48,   # Enough candidates for small top-k chat queries
+                exact=False,
+                quantization=QuantizationSearchParams(rescore=True, oversampling=2.0)
+            )
         )
 
         # Format results
@@ -66,3 +168,18 @@ class ArizonaPlantVectorStore:
         
         print(f"✓ Found {len(results)} results")
         return results
+    
+    async def search_async(self, query: str, limit: int = 5, with_metadata: bool = False):
+        """
+        Run search() in a worker thread so the encode and Qdrant call
+        don't block the event loop
+        
+        Args:
+            query: Search query string
+            limit: Number of results to return
+            with_metadata: Also return the metadata payload
+            
+        Returns:
+            List of search results with metadata
+        """
+        return await anyio.to_thread.run_sync(self.search, query, limit, with_metadata)
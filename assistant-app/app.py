@@ -3,22 +3,81 @@ Arizona Desert Plants RAG API
 FastAPI application for querying the plant knowledge base
 """
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from typing import List, Dict, Optional
 import os
+import time
+import hashlib
 from datetime import datetime
 
 # Import your custom classes
 from ArizonaPlantVectorStore import ArizonaPlantVectorStore
 from ArizonaPlantRAG import ArizonaPlantRAG
 
+# Configuration from environment variables
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "onnx")
+COLLECTION_NAME = os.getenv("COLLECTION_NAME", "arizona_plants")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "300"))  # seconds, 0 disables
+RESPONSE_CACHE_MAX_SIZE = 1024
+
+# Global variables for vector store and RAG (initialized on startup)
+vector_store = None
+rag = None
+
+# In-process response cache: key -> (expires_at, response)
+response_cache: Dict[str, tuple] = {}
+
+# Lifespan - initialize components once per process, before serving requests
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize vector store and RAG on startup"""
+    global vector_store, rag
+    
+    print("Initializing Arizona Desert Plants RAG API...")
+    
+    try:
+        # Initialize vector store
+        vector_store = ArizonaPlantVectorStore(
+            embedding_model_name=EMBEDDING_MODEL,
+            collection_name=COLLECTION_NAME,
+            qdrant_url=QDRANT_URL,
+            embedding_backend=EMBEDDING_BACKEND
+        )
+        print(f"✓ Connected to Qdrant at {QDRANT_URL}")
+
+        # Initialize RAG
+        rag = ArizonaPlantRAG(
+            vector_store=vector_store
+        )
+        print("✓ RAG system initialized")
+        
+        # Verify collection exists
+        # collection_info = vector_store.client.get_collection(COLLECTION_NAME)
+        # print(f"✓ Collection '{COLLECTION_NAME}' has {collection_info.points_count} documents")
+        
+    except Exception as e:
+        print(f"✗ Error during startup: {e}")
+        raise
+    
+    yield
+    
+    print("Shutting down Arizona Desert Plants RAG API...")
+    vector_store.client.close()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Arizona Desert Plants Assistant API",
     description="RAG-powered API for Arizona desert plant information",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware (allows frontend to call API)
@@ -30,16 +89,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Configuration from environment variables
-QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
-EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
-COLLECTION_NAME = os.getenv("COLLECTION_NAME", "arizona_plants")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-
-# Global variables for vector store and RAG (initialized on startup)
-vector_store = None
-rag = None
-
 # Request/Response Models
 class QueryRequest(BaseModel):
     question: str = Field(..., description="User's question about desert plants", min_length=3)
@@ -75,36 +124,28 @@ class HealthResponse(BaseModel):
     document_count: Optional[int] = None
     timestamp: str
 
-# Startup event - initialize components
-@app.on_event("startup")
-async def startup_event():
-    """Initialize vector store and RAG on startup"""
-    global vector_store, rag
-    
-    print("Initializing Arizona Desert Plants RAG API...")
-    
-    try:
-        # Initialize vector store
-        vector_store = ArizonaPlantVectorStore(
-            embedding_model_name=EMBEDDING_MODEL,
-            collection_name=COLLECTION_NAME,
-            qdrant_url=QDRANT_URL
-        )
-        print(f"✓ Connected to Qdrant at {QDRANT_URL}")
+# Response cache helpers
+def response_cache_key(endpoint: str, question: str, top_k: int) -> str:
+    """Cache key for an endpoint response, hashed from (question, top_k)"""
+    return hashlib.blake2b(f"{endpoint}|{question}|{top_k}".encode(), digest_size=16).hexdigest()
 
-        # Initialize RAG
-        rag = ArizonaPlantRAG(
-            vector_store=vector_store
-        )
-        print("✓ RAG system initialized")
-        
-        # Verify collection exists
-        # collection_info = vector_store.client.get_collection(COLLECTION_NAME)
-        # print(f"✓ Collection '{COLLECTION_NAME}' has {collection_info.points_count} documents")
-        
-    except Exception as e:
-        print(f"✗ Error during startup: {e}")
-        raise
+def get_cached_response(key: str):
+    """Return a cached response, or None if missing or expired"""
+    entry = response_cache.get(key)
+    if entry is None:
+        return None
+    if entry[0] < time.monotonic():
+        response_cache.pop(key, None)
+        return None
+    return entry[1]
+
+def set_cached_response(key: str, response):
+    """Cache a response for RESPONSE_CACHE_TTL seconds (evicts the oldest entry when full)"""
+    if RESPONSE_CACHE_TTL <= 0:
+        return
+    if key not in response_cache and len(response_cache) >= RESPONSE_CACHE_MAX_SIZE:
+        response_cache.pop(next(iter(response_cache)))
+    response_cache[key] = (time.monotonic() + RESPONSE_CACHE_TTL, response)
 
 # API Endpoints
 
@@ -118,6 +159,7 @@ async def root():
         "endpoints": {
             "health": "/health",
             "query": "/query",
+            "query_stream": "/query/stream",
             "search": "/search",
             "docs": "/docs"
         }
@@ -147,7 +189,7 @@ async def health_check():
         )
 
 @app.post("/query", response_model=QueryResponse, tags=["RAG"])
-async def query_rag(request: QueryRequest):
+async def query_rag(request: QueryRequest, nocache: bool = False):
     """
     Query the RAG system with a question about desert plants
     
@@ -155,16 +197,21 @@ async def query_rag(request: QueryRequest):
     1. Retrieves relevant documents from the vector store
     2. Generates a comprehensive answer using GPT-4
     3. Returns both the answer and source documents
+    
+    Responses are cached per (question, top_k); pass ?nocache=1 to bypass
     """
     try:
         if not rag or not vector_store:
             raise HTTPException(status_code=503, detail="RAG system not initialized")
         
-        # Get answer from RAG
-        answer = rag.rag(request.question)
+        cache_key = response_cache_key("query", request.question, request.top_k)
+        if not nocache:
+            cached = get_cached_response(cache_key)
+            if cached is not None:
+                return cached
         
-        # Get retrieved documents for transparency
-        retrieved_docs = vector_store.search(request.question, limit=request.top_k)
+        # Get answer from RAG, reusing its retrieved documents for transparency
+        answer, retrieved_docs = await rag.rag(request.question, limit=request.top_k)
         
         # Format search results
         search_results = [
@@ -179,12 +226,15 @@ async def query_rag(request: QueryRequest):
             for doc in retrieved_docs
         ]
         
-        return QueryResponse(
+        response = QueryResponse(
             question=request.question,
             answer=answer,
             retrieved_documents=search_results,
             timestamp=datetime.now().isoformat()
         )
+        set_cached_response(cache_key, response)
+        
+        return response
         
     except Exception as e:
         import traceback
@@ -192,8 +242,33 @@ async def query_rag(request: QueryRequest):
         print(traceback.format_exc())  # Print full stack trace
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
 
+@app.post("/query/stream", tags=["RAG"])
+async def query_rag_stream(request: QueryRequest):
+    """
+    Query the RAG system and stream the answer as plain text
+    
+    Same pipeline as /query, but answer tokens are sent as soon as the
+    LLM generates them instead of after the full answer is ready
+    """
+    try:
+        if not rag or not vector_store:
+            raise HTTPException(status_code=503, detail="RAG system not initialized")
+        
+        # Retrieve context and open the LLM stream before the response starts,
+        # so setup failures (search, auth, rate limits) surface as HTTP errors
+        retrieved_docs = await vector_store.search_async(request.question, limit=request.top_k)
+        prompt = rag.build_prompt(request.question, retrieved_docs)
+        stream = await rag.start_stream(prompt)
+        
+        return StreamingResponse(rag.stream_text(stream), media_type="text/plain")
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
+
 @app.post("/search", tags=["Search"])
-async def search_documents(request: QueryRequest):
+async def search_documents(request: QueryRequest, nocache: bool = False):
     """
     Search for relevant documents without generating an answer
     
@@ -201,13 +276,21 @@ async def search_documents(request: QueryRequest):
     - Exploring the knowledge base
     - Testing retrieval quality
     - Building custom applications
+    
+    Responses are cached per (question, top_k); pass ?nocache=1 to bypass
     """
     try:
         if not vector_store:
             raise HTTPException(status_code=503, detail="Vector store not initialized")
         
+        cache_key = response_cache_key("search", request.question, request.top_k)
+        if not nocache:
+            cached = get_cached_response(cache_key)
+            if cached is not None:
+                return cached
+        
         # Search documents
-        results = vector_store.search(request.question, limit=request.top_k)
+        results = await vector_store.search_async(request.question, limit=request.top_k)
         
         # Format results
         search_results = [
@@ -222,12 +305,15 @@ async def search_documents(request: QueryRequest):
             for doc in results
         ]
         
-        return {
+        response = {
             "query": request.question,
             "results": search_results,
             "count": len(search_results),
             "timestamp": datetime.now().isoformat()
         }
+        set_cached_response(cache_key, response)
+        
+        return response
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error searching documents: {str(e)}")
@@ -243,6 +329,7 @@ async def get_statistics():
             "total_documents": collection_info.points_count,
             "vector_dimension": collection_info.config.params.vectors.size,
             "embedding_model": EMBEDDING_MODEL,
+            "embedding_backend": EMBEDDING_BACKEND,
             "timestamp": datetime.now().isoformat()
         }
         
@@ -252,4 +339,4 @@ async def get_statistics():
 # Run with: uv run uvicorn app:app --reload
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000, workers=1, loop="uvloop")
\ No newline at end of file
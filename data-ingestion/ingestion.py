@@ -1,19 +1,68 @@
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
+from qdrant_client.models import (
+    Distance, VectorParams,
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType,
+    SearchParams, QuantizationSearchParams, HnswConfigDiff
+)
 from sentence_transformers import SentenceTransformer
-from tqdm import tqdm
 from typing import List, Dict
 from pathlib import Path
 
 import os
 import json
+import hashlib
+import numpy as np
+import torch
+
+# Characters kept per window token before tokenizing; well above typical
+# English (~4) and whitespace-heavy PDF text, only bounds tokenizer work
+MAX_CHARS_PER_TOKEN = 8
+
+# int8 dynamic-quantized ONNX export shipped with the sentence-transformers models
+ONNX_MODEL_FILE = 'onnx/model_qint8_avx512_vnni.onnx'
+
+
+_torch_threads_configured = False
+
+def configure_torch_threads():
+    """Pin torch thread pools once per process (safe to call repeatedly)"""
+    global _torch_threads_configured
+    if _torch_threads_configured:
+        return
+    _torch_threads_configured = True
+    
+    # CPUs this process may run on (respects container/cpuset limits)
+    if hasattr(os, 'sched_getaffinity'):
+        cpu_count = len(os.sched_getaffinity(0))
+    else:
+        cpu_count = os.cpu_count() or 1
+    
+    # Use every core for intra-op math (some deployments default to 1 thread)
+    torch.set_num_threads(cpu_count)
+    try:
+        torch.set_num_interop_threads(2)
+    except RuntimeError:
+        # Already set, or inter-op work already ran in this process
+        pass
 
 
 class ArizonaPlantVectorStore:
+    """
+    Builds and queries the Arizona plants Qdrant collection
+    
+    HNSW settings (m=16, ef_construct=100, in RAM, search ef=48) only take
+    effect once segments grow past Qdrant's indexing_threshold (20,000 KB by
+    default) and get an HNSW graph. The current dataset (~340 x 384 floats,
+    ~0.5 MB) stays unindexed: every search is an exact scan, and ef, m and
+    the bulk-load m=0/m=16 toggle have no effect. On a larger collection,
+    ef=48 trades a little recall for lower latency at top-5 chat queries.
+    """
     def __init__(self, 
                  embedding_model_name='all-MiniLM-L6-v2',
                  collection_name='arizona_plants',
-                 qdrant_url='http://localhost:6333'):
+                 qdrant_url='http://localhost:6333',
+                 embedding_backend='onnx',
+                 cache_dir=None):
         """
         Initialize the vector store
         
@@ -23,6 +72,10 @@ class ArizonaPlantVectorStore:
                 - 'all-mpnet-base-v2': Better quality, 768 dimensions
                 - 'multi-qa-MiniLM-L6-cos-v1': Optimized for Q&A
             collection_name: Name for the Qdrant collection
+            embedding_backend: 'onnx' (quantized ONNX Runtime, CPU) or 'torch'
+                - Must match the backend used by the assistant app
+            cache_dir: Directory for cached document embeddings
+                (defaults to data-ingestion/embeddings_cache)
         """
         print("="*60)
         print("Arizona Desert Plants RAG - Vector Store Setup")
@@ -30,17 +83,35 @@ class ArizonaPlantVectorStore:
         
         self.collection_name = collection_name
         self.qdrant_url = qdrant_url
+        self.embedding_model_name = embedding_model_name
+        self.embedding_backend = embedding_backend
+        self.cache_dir = Path(cache_dir) if cache_dir else Path(__file__).parent / 'embeddings_cache'
+        
+        configure_torch_threads()
         
         # Initialize embedding model
-        print(f"\n1. Loading embedding model: {embedding_model_name}")
-        self.embedding_model = SentenceTransformer(embedding_model_name)
+        print(f"\n1. Loading embedding model: {embedding_model_name} ({embedding_backend})")
+        if embedding_backend == 'onnx':
+            self.embedding_model = SentenceTransformer(
+                embedding_model_name,
+                backend='onnx',
+                model_kwargs={'file_name': ONNX_MODEL_FILE, 'provider': 'CPUExecutionProvider'}
+            )
+        else:
+            self.embedding_model = SentenceTransformer(embedding_model_name)
+            if self.embedding_model.device.type == 'cuda':
+                self.embedding_model.half()
+            else:
+                # Let oneDNN run FP32 matmuls on BF16 kernels (AMX/AVX-512)
+                torch.backends.mkldnn.matmul.fp32_precision = 'bf16'
+        self.embedding_model.eval()
         self.embedding_dim = self.embedding_model.get_sentence_embedding_dimension()
         print(f"   ✓ Model loaded (dimension: {self.embedding_dim})")
         
         # Initialize Qdrant client
         print("\n2. Initializing Qdrant client")
-        self.client = QdrantClient(url=self.qdrant_url)
-        print("   ✓ Client initialized")
+        self.client = QdrantClient(url=self.qdrant_url, prefer_grpc=True)
+        print("   ✓ Client initialized (gRPC)")
         
     def load_dataset(self, dataset_path: str) -> List[Dict]:
         """Load the unified dataset"""
@@ -82,10 +153,20 @@ class ArizonaPlantVectorStore:
             collection_name=self.collection_name,
             vectors_config=VectorParams(
                 size=self.embedding_dim,
-                distance=Distance.COSINE  # Cosine similarity for semantic search
+                distance=Distance.DOT  # Vectors are unit-normalized, so dot product == cosine
+            ),
+            # Keep the HNSW graph in RAM; on-disk indexes add latency
+            hnsw_config=HnswConfigDiff(m=16, ef_construct=100, on_disk=False),
+            # int8 scalar quantization: 4x smaller vectors kept in RAM
+            quantization_config=ScalarQuantization(
+                scalar=ScalarQuantizationConfig(
+                    type=ScalarType.INT8,
+                    quantile=0.99,
+                    always_ram=True
+                )
             )
         )
-        print(f"   ✓ Collection created (vector size: {self.embedding_dim})")
+        print(f"   ✓ Collection created (vector size: {self.embedding_dim}, int8 quantized)")
     
     def prepare_text_for_embedding(self, document: Dict) -> str:
         """
@@ -98,20 +179,80 @@ class ArizonaPlantVectorStore:
         # Combine title and content (title gets more weight by being first)
         text = f"{title}\n\n{content}"
         
-        # Limit to reasonable length (most embedding models have token limits)
-        max_chars = 5000  # Adjust based on your model
-        if len(text) > max_chars:
-            text = text[:max_chars]
+        # The model only sees max_seq_length tokens (256 for MiniLM); cut the
+        # text where that window ends so nothing is encoded past it
+        max_tokens = self.embedding_model.max_seq_length
+        
+        # Every token covers at least one character, so short texts always fit
+        if len(text) <= max_tokens:
+            return text
+        
+        # Generous character pre-cap bounds the tokenizer's work on long texts
+        # (far above the window, so it never cuts inside it)
+        text = text[:max_tokens * MAX_CHARS_PER_TOKEN]
+        
+        encoding = self.embedding_model.tokenizer(
+            text,
+            truncation=True,
+            max_length=max_tokens,
+            return_offsets_mapping=True
+        )
+        # Special tokens map to (0, 0); the last real token's end is the cut point
+        token_ends = [end for _, end in encoding['offset_mapping'] if end]
+        if token_ends and token_ends[-1] < len(text):
+            text = text[:token_ends[-1]]
         
         return text
     
-    def create_embeddings(self, documents: List[Dict], batch_size: int = 32) -> List[Dict]:
+    def _cache_paths(self):
+        """Paths of the embedding cache files for the current model/backend"""
+        stem = f"{self.embedding_model_name.replace('/', '_')}_{self.embedding_backend}"
+        return (self.cache_dir / f"{stem}_keys.npy",
+                self.cache_dir / f"{stem}_vectors.npy")
+    
+    def load_embedding_cache(self) -> Dict[str, np.ndarray]:
+        """
+        Load cached embeddings keyed by content hash
+        
+        Vectors are memory-mapped, so only the rows actually used are read
+        """
+        keys_path, vectors_path = self._cache_paths()
+        if not (keys_path.exists() and vectors_path.exists()):
+            return {}
+        
+        keys = np.load(keys_path)
+        vectors = np.load(vectors_path, mmap_mode='r')
+        return dict(zip(keys.tolist(), vectors))
+    
+    def save_embedding_cache(self, embeddings_by_hash: Dict[str, np.ndarray]):
+        """Save embeddings keyed by content hash (stored as float16)"""
+        keys_path, vectors_path = self._cache_paths()
+        
+        # Nothing to cache; remove stale files (empty arrays can't be memory-mapped)
+        if not embeddings_by_hash:
+            keys_path.unlink(missing_ok=True)
+            vectors_path.unlink(missing_ok=True)
+            return
+        
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        keys = np.array(list(embeddings_by_hash.keys()))
+        vectors = np.stack(list(embeddings_by_hash.values())).astype(np.float16)
+        
+        # Write to temp files first; the old cache may still be memory-mapped
+        for path, array in ((keys_path, keys), (vectors_path, vectors)):
+            tmp_path = path.with_suffix('.tmp.npy')
+            np.save(tmp_path, array)
+            os.replace(tmp_path, path)
+    
+    def create_embeddings(self, documents: List[Dict], batch_size: int = 32,
+                          use_cache: bool = True) -> List[Dict]:
         """
         Create embeddings for all documents
         
         Args:
             documents: List of document dicts
             batch_size: Number of documents to process at once
+            use_cache: Reuse cached embeddings for unchanged documents
             
         Returns:
             List of dicts with documents and their embeddings
@@ -120,22 +261,46 @@ class ArizonaPlantVectorStore:
         
         # Prepare texts
         texts = [self.prepare_text_for_embedding(doc) for doc in documents]
-        
-        # Create embeddings in batches
-        all_embeddings = []
-        
-        print("   Processing batches...")
-        for i in tqdm(range(0, len(texts), batch_size), desc="   Embedding"):
-            batch_texts = texts[i:i + batch_size]
-            batch_embeddings = self.embedding_model.encode(
-                batch_texts,
-                show_progress_bar=False,
-                convert_to_numpy=True
-            )
-            all_embeddings.extend(batch_embeddings)
+        hashes = [hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+                  for text in texts]
+        
+        # Reuse embeddings of unchanged documents
+        cache = self.load_embedding_cache() if use_cache else {}
+        missing = [i for i, h in enumerate(hashes) if h not in cache]
+        print(f"   Cached: {len(texts) - len(missing)} | To encode: {len(missing)}")
+        
+        all_embeddings = np.empty((len(texts), self.embedding_dim), dtype=np.float32)
+        for i, h in enumerate(hashes):
+            if h in cache:
+                all_embeddings[i] = cache[h]
+        
+        if missing:
+            # Sort by length so each batch only pads to similarly sized texts
+            order = sorted(missing, key=lambda i: len(texts[i]))
+            sorted_texts = [texts[i] for i in order]
+            
+            # Single encode call; sentence-transformers batches internally
+            print("   Processing batches...")
+            with torch.inference_mode():
+                sorted_embeddings = self.embedding_model.encode(
+                    sorted_texts,
+                    batch_size=batch_size,
+                    show_progress_bar=True,
+                    convert_to_numpy=True,
+                    normalize_embeddings=True
+                )
+            
+            # Restore the original document order
+            all_embeddings[order] = sorted_embeddings
         
         print(f"   ✓ Created {len(all_embeddings)} embeddings")
         
+        # Refresh the cache (adds new documents, drops removed ones); an empty
+        # dataset leaves the existing cache untouched
+        if use_cache and hashes and set(cache) != set(hashes):
+            self.save_embedding_cache(dict(zip(hashes, all_embeddings)))
+            print(f"   ✓ Embedding cache updated: {self.cache_dir}")
+        
         # Combine documents with embeddings
         documents_with_embeddings = [
             {
@@ -152,38 +317,54 @@ class ArizonaPlantVectorStore:
         """Upload documents and embeddings to Qdrant"""
         print(f"\n6. Uploading to Qdrant")
         
-        points = []
-        for idx, item in enumerate(documents_with_embeddings):
-            doc = item['document']
-            embedding = item['embedding']
-            
-            # Create point with embedding and metadata
-            point = PointStruct(
-                id=idx,
-                vector=embedding.tolist(),
-                payload={
-                    'id': doc.get('id'),
-                    'type': doc.get('type'),
-                    'source': doc.get('source'),
-                    'title': doc.get('title'),
-                    'content': doc.get('content'),
-                    'metadata': doc.get('metadata', {})
-                }
-            )
-            points.append(point)
+        if not documents_with_embeddings:
+            print("   - No documents to upload")
+            return
+        
+        # One float32 array instead of a PointStruct per document
+        # (the uploader still converts each batch slice with .tolist())
+        vectors = np.stack([item['embedding'] for item in documents_with_embeddings]).astype(np.float32)
+        payloads = (
+            {
+                'id': item['document'].get('id'),
+                'type': item['document'].get('type'),
+                'source': item['document'].get('source'),
+                'title': item['document'].get('title'),
+                'content': item['document'].get('content'),
+                'metadata': item['document'].get('metadata', {})
+            }
+            for item in documents_with_embeddings
+        )
         
-        # Upload in batches
-        batch_size = 100
-        print(f"   Uploading in batches of {batch_size}...")
+        # Disable HNSW indexing during bulk load, build the graph once afterwards
+        # (no-op until the collection is large enough to be indexed)
+        self.client.update_collection(
+            collection_name=self.collection_name,
+            hnsw_config=HnswConfigDiff(m=0)
+        )
         
-        for i in tqdm(range(0, len(points), batch_size), desc="   Uploading"):
-            batch = points[i:i + batch_size]
-            self.client.upsert(
-                collection_name=self.collection_name,
-                points=batch
-            )
+        # Upload in parallel batches
+        batch_size = 256
+        parallel = max(1, (os.cpu_count() or 1) // 2)
+        print(f"   Uploading in batches of {batch_size} ({parallel} workers)...")
         
-        print(f"   ✓ Uploaded {len(points)} documents")
+        self.client.upload_collection(
+            collection_name=self.collection_name,
+            vectors=vectors,
+            payload=payloads,
+            ids=list(range(len(vectors))),
+            batch_size=batch_size,
+            parallel=parallel,
+            wait=True
+        )
+        
+        # Re-enable HNSW indexing
+        self.client.update_collection(
+            collection_name=self.collection_name,
+            hnsw_config=HnswConfigDiff(m=16)
+        )
+        
+        print(f"   ✓ Uploaded {len(vectors)} documents")
     
     def build_index(self, dataset_path: str):
         """Complete pipeline: load data, create embeddings, upload to Qdrant"""
@@ -220,13 +401,20 @@ class ArizonaPlantVectorStore:
             List of matching documents with scores
         """
         # Embed the query
-        query_embedding = self.embedding_model.encode(query)
+        with torch.inference_mode():
+            query_embedding = self.embedding_model.encode(query, normalize_embeddings=True)
         
         # Search in Qdrant
         results = self.client.search(
             collection_name=self.collection_name,
-            query_vector=query_embedding.tolist(),
-            limit=limit
+            query_vector=query_embedding,
+            limit=limit,
+            # Search on int8 vectors, then rescore the top candidates in float32
+            search_params=SearchParams(
+                hnsw_ef=48,   # Enough candidates for small top-k chat queries
+                exact=False,
+                quantization=QuantizationSearchParams(rescore=True, oversampling=2.0)
+            )
         )
         
         # Format results
@@ -272,6 +460,7 @@ if __name__ == "__main__":
     DATASET_PATH = "data-preparation/arizona_plants_unified_20251018.jsonl"
     EMBEDDING_MODEL = "all-MiniLM-L6-v2"  # Fast and efficient
     QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+    EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "onnx")  # or "torch"
 
     # Alternative models (uncomment to use):
     # EMBEDDING_MODEL = "all-mpnet-base-v2"  # Better quality, slower
@@ -282,7 +471,8 @@ if __name__ == "__main__":
         vector_store = ArizonaPlantVectorStore(
             embedding_model_name=EMBEDDING_MODEL,
             collection_name='arizona_plants',
-            qdrant_url=QDRANT_URL
+            qdrant_url=QDRANT_URL,
+            embedding_backend=EMBEDDING_BACKEND
         )
         
         # Build the index
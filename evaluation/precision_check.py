@@ -0,0 +1,110 @@
+"""
+Compare reduced-precision (torch backend) search scores against FP32
+
+The torch embedding backend runs FP32 matmuls on BF16 kernels on CPU (or casts
+the model to FP16 on CUDA). This script encodes the dataset and a few test
+queries both ways and checks that query-document scores stay within tolerance.
+No Qdrant needed: with unit-normalized vectors, Qdrant's DOT score is the
+plain dot product computed here.
+
+Run from the repository root:
+    uv run python evaluation/precision_check.py
+"""
+
+from sentence_transformers import SentenceTransformer
+
+import os
+import sys
+import numpy as np
+import torch
+
+sys.path.append('data-ingestion')
+sys.path.append('../data-ingestion')
+
+from ingestion import ArizonaPlantVectorStore
+
+
+def encode(model, texts, fp32_precision):
+    """Encode texts with the given oneDNN FP32 matmul precision"""
+    torch.backends.mkldnn.matmul.fp32_precision = fp32_precision
+    with torch.inference_mode():
+        return model.encode(
+            texts,
+            batch_size=32,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        ).astype(np.float32)
+
+
+def compare_scores(dataset_path: str, embedding_model_name: str,
+                   test_queries, top_k: int = 5, tolerance: float = 1e-3) -> bool:
+    """
+    Compare FP32 and reduced-precision query-document scores
+
+    Args:
+        dataset_path: Dataset used to build the index
+        embedding_model_name: SentenceTransformer model name
+        test_queries: Queries to score against every document
+        top_k: Number of top results compared for ranking agreement
+        tolerance: Largest allowed absolute score difference
+
+    Returns:
+        True if every score is within tolerance
+    """
+    # Reduced-precision model, configured exactly as ingestion/the app do
+    vector_store = ArizonaPlantVectorStore(
+        embedding_model_name=embedding_model_name,
+        qdrant_url=os.getenv("QDRANT_URL", "http://localhost:6333"),
+        embedding_backend='torch'
+    )
+    reduced_model = vector_store.embedding_model
+
+    # FP32 baseline (a separate model, since CUDA casts the store's model to FP16)
+    baseline_model = SentenceTransformer(embedding_model_name, device=reduced_model.device)
+    baseline_model.eval()
+
+    documents = vector_store.load_dataset(dataset_path)
+    texts = [vector_store.prepare_text_for_embedding(doc) for doc in documents]
+
+    print(f"\nEncoding {len(texts)} documents and {len(test_queries)} queries twice...")
+    baseline_docs = encode(baseline_model, texts, 'ieee')
+    baseline_queries = encode(baseline_model, test_queries, 'ieee')
+    reduced_docs = encode(reduced_model, texts, 'bf16')
+    reduced_queries = encode(reduced_model, test_queries, 'bf16')
+
+    baseline_scores = baseline_queries @ baseline_docs.T
+    reduced_scores = reduced_queries @ reduced_docs.T
+    diff = np.abs(baseline_scores - reduced_scores)
+
+    print(f"\n{'='*60}")
+    print("FP32 vs reduced-precision scores")
+    print(f"{'='*60}")
+    print(f"Max abs score difference:  {diff.max():.6f}")
+    print(f"Mean abs score difference: {diff.mean():.6f}")
+
+    for query, base_row, reduced_row in zip(test_queries, baseline_scores, reduced_scores):
+        base_top = np.argsort(-base_row)[:top_k]
+        reduced_top = np.argsort(-reduced_row)[:top_k]
+        overlap = len(set(base_top) & set(reduced_top))
+        print(f"\nQuery: '{query}'")
+        print(f"   Top-{top_k} overlap: {overlap}/{top_k} | "
+              f"same order: {list(base_top) == list(reduced_top)}")
+
+    within_tolerance = bool(diff.max() <= tolerance)
+    print(f"\n{'✓' if within_tolerance else '✗'} Scores within {tolerance:g} of FP32: {within_tolerance}")
+    return within_tolerance
+
+
+if __name__ == "__main__":
+    # Configuration
+    DATASET_PATH = "data-preparation/arizona_plants_unified_20251018.jsonl"
+    EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+    TEST_QUERIES = [
+        "What cacti can survive in Phoenix summer heat?",
+        "How to care for saguaro cactus?",
+        "Desert plants that need minimal water",
+        "Native plants for Arizona landscaping"
+    ]
+
+    ok = compare_scores(DATASET_PATH, EMBEDDING_MODEL, TEST_QUERIES)
+    sys.exit(0 if ok else 1)